@@ -3,10 +3,17 @@ import sqlite3
 import threading
 import time
 import asyncio
+import atexit
+import logging
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
-from flask import Flask, request
+import orjson
+from quart import Quart, request
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.request import HTTPXRequest
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -16,6 +23,12 @@ from telegram.ext import (
     ContextTypes,
 )
 
+# -------------------- Logging --------------------
+# Configured once at module scope; per-request debug output goes through
+# here instead of ad-hoc file appends or prints on the webhook hot path.
+logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
+logger = logging.getLogger(__name__)
+
 # -------------------- Load Environment Variables --------------------
 load_dotenv()
 
@@ -24,13 +37,16 @@ PRIVATE_CHANNEL_ID = os.getenv("PRIVATE_CHANNEL_ID")
 if PRIVATE_CHANNEL_ID and PRIVATE_CHANNEL_ID.lstrip("-").isdigit():
     PRIVATE_CHANNEL_ID = int(PRIVATE_CHANNEL_ID)
 
-ADMIN_IDS = []
+_admin_ids = []
 _admins = os.getenv("ADMIN_IDS", "")
 if _admins:
     for x in _admins.split(","):
         x = x.strip()
         if x and x.isdigit():
-            ADMIN_IDS.append(int(x))
+            _admin_ids.append(int(x))
+# Tuple for ordered iteration (photo fan-out), frozenset for O(1) auth checks
+ADMIN_IDS = tuple(_admin_ids)
+ADMIN_ID_SET = frozenset(_admin_ids)
 
 PORT = int(os.environ.get("PORT", 8000))
 APP_URL = os.getenv("APP_URL", "https://commercial-emma-robel-e81fbc32.koyeb.app")
@@ -45,61 +61,164 @@ if not PRIVATE_CHANNEL_ID:
 DB_PATH = "subscriptions.db"
 db_lock = threading.Lock()
 
+class _ConnectionPool:
+    """One long-lived writer connection plus a small pool of reader connections.
+
+    SQLite in WAL mode supports a single writer and many concurrent readers,
+    so we keep exactly one writer (guarded by db_lock) and hand out readers
+    from a queue. Keeping connections open avoids re-paying the file open and
+    page-cache warm-up on every query.
+    """
+
+    def __init__(self, path, readers=4):
+        self.writer = self._open(path)
+        self._readers = queue.Queue(maxsize=readers)
+        for _ in range(readers):
+            self._readers.put(self._open(path))
+
+    @staticmethod
+    def _open(path):
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=memory")
+        conn.execute("PRAGMA cache_size=-64000")
+        return conn
+
+    @contextmanager
+    def reader(self):
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    def close(self):
+        self.writer.close()
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
+
+pool = _ConnectionPool(DB_PATH)
+atexit.register(pool.close)
+
+SCHEMA_VERSION = 1
+
 def init_db():
+    # Run the DDL only when the schema is older than SCHEMA_VERSION, so a
+    # warm boot skips the CREATE ... IF NOT EXISTS parsing entirely.
     with db_lock:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS subscriptions (
+        version = pool.writer.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        pool.writer.execute('''CREATE TABLE IF NOT EXISTS subscriptions (
                         user_id INTEGER PRIMARY KEY,
                         expiry_date INTEGER NOT NULL)''')
-        conn.commit()
-        conn.close()
+        pool.writer.execute("CREATE INDEX IF NOT EXISTS idx_expiry ON subscriptions(expiry_date)")
+        pool.writer.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        pool.writer.commit()
 
 def add_subscription(user_id, days):
     expiry = int(time.time()) + days * 86400
     with db_lock:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("REPLACE INTO subscriptions (user_id, expiry_date) VALUES (?, ?)", (user_id, expiry))
-        conn.commit()
-        conn.close()
+        # Upsert instead of REPLACE: REPLACE is delete+insert (two B-tree
+        # operations); ON CONFLICT updates the existing row in place.
+        pool.writer.execute(
+            "INSERT INTO subscriptions (user_id, expiry_date) VALUES (?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET expiry_date = excluded.expiry_date",
+            (user_id, expiry))
+        pool.writer.commit()
 
 def remove_subscription(user_id):
     with db_lock:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("DELETE FROM subscriptions WHERE user_id = ?", (user_id,))
-        conn.commit()
-        conn.close()
+        pool.writer.execute("DELETE FROM subscriptions WHERE user_id = ?", (user_id,))
+        pool.writer.commit()
+
+def remove_subscriptions(user_ids):
+    """Delete the given subscriptions in one transaction.
+
+    A single commit instead of one DELETE+fsync per expired user.
+    """
+    if not user_ids:
+        return
+    with db_lock:
+        pool.writer.executemany(
+            "DELETE FROM subscriptions WHERE user_id = ?",
+            [(user_id,) for user_id in user_ids])
+        pool.writer.commit()
 
 def get_expired_users(now=None):
     if now is None:
         now = int(time.time())
-    with db_lock:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("SELECT user_id FROM subscriptions WHERE expiry_date <= ?", (now,))
-        expired = [row[0] for row in c.fetchall()]
-        conn.close()
-    return expired
+    with pool.reader() as conn:
+        c = conn.execute("SELECT user_id FROM subscriptions WHERE expiry_date <= ?", (now,))
+        return [row[0] for row in c.fetchall()]
 
 def get_subscription_expiry(user_id):
-    with db_lock:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("SELECT expiry_date FROM subscriptions WHERE user_id = ?", (user_id,))
+    with pool.reader() as conn:
+        c = conn.execute("SELECT expiry_date FROM subscriptions WHERE user_id = ?", (user_id,))
         row = c.fetchone()
-        conn.close()
         return row[0] if row else None
 
+def get_all_subscriptions():
+    with pool.reader() as conn:
+        c = conn.execute("SELECT user_id, expiry_date FROM subscriptions ORDER BY expiry_date")
+        return c.fetchall()
+
+# Async wrappers so SQLite never blocks the event loop. Writes go through a
+# single-thread executor (SQLite allows one writer at a time, so this also
+# serializes them); reads get their own multi-worker executor since WAL
+# supports concurrent readers.
+_db_write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+_db_read_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="db-read")
+
+async def add_subscription_async(user_id, days):
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(_db_write_executor, add_subscription, user_id, days)
+
+async def remove_subscription_async(user_id):
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(_db_write_executor, remove_subscription, user_id)
+
+async def remove_subscriptions_async(user_ids):
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(_db_write_executor, remove_subscriptions, user_ids)
+
+async def get_expired_users_async(now=None):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_read_executor, get_expired_users, now)
+
+async def get_subscription_expiry_async(user_id):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_read_executor, get_subscription_expiry, user_id)
+
+async def get_all_subscriptions_async():
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_read_executor, get_all_subscriptions)
+
 init_db()
 
-# -------------------- Flask App --------------------
-app = Flask(__name__)
+# -------------------- Quart App --------------------
+# ASGI so webhook handlers run natively on the serving event loop – no
+# per-request asyncio.run and no blocked worker threads during Telegram I/O.
+app = Quart(__name__)
 
 # -------------------- Telegram Bot Setup --------------------
-# Build application WITHOUT an updater (essential for webhook mode)
-application = Application.builder().token(BOT_TOKEN).updater(None).build()
+# Build application WITHOUT an updater (essential for webhook mode).
+# Size the httpx pool for the webhook's max_connections=100 so concurrent
+# updates reuse keep-alive connections instead of queueing on the default
+# tiny pool or re-doing the TLS handshake.
+application = (
+    Application.builder()
+    .token(BOT_TOKEN)
+    .updater(None)
+    .request(HTTPXRequest(
+        connection_pool_size=100,
+        pool_timeout=5.0,
+        connect_timeout=5.0,
+        read_timeout=20.0,
+    ))
+    .build()
+)
 
 # Prices in Ethiopian Birr
 TELEBIRR_ACCOUNT = "0987973732"
@@ -113,13 +232,50 @@ def format_expiry(timestamp):
     dt = datetime.fromtimestamp(timestamp)
     return f"`{dt.strftime('%Y-%m-%d %H:%M:%S')}`"
 
-def plan_keyboard():
-    keyboard = [
-        [InlineKeyboardButton(f"1 Month – {PRICE_1} Birr", callback_data="plan:1")],
-        [InlineKeyboardButton(f"2 Months – {PRICE_2} Birr", callback_data="plan:2")],
-        [InlineKeyboardButton(f"3 Months – {PRICE_3} Birr", callback_data="plan:3")],
-    ]
-    return InlineKeyboardMarkup(keyboard)
+# Static keyboards/labels built once at import; PTB markup objects are
+# immutable, so sharing one instance across updates is safe.
+PLAN_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton(f"1 Month – {PRICE_1} Birr", callback_data="plan:1")],
+    [InlineKeyboardButton(f"2 Months – {PRICE_2} Birr", callback_data="plan:2")],
+    [InlineKeyboardButton(f"3 Months – {PRICE_3} Birr", callback_data="plan:3")],
+])
+_APPROVE_LABEL = "✅ Approve ({months} months)"
+_DECLINE_LABEL = "❌ Decline"
+
+# Short-lived cache of invite-link tasks keyed by (user_id, days). Saves
+# an HTTPS round-trip and doubles as an idempotency guard: caching the
+# in-flight task (not the finished link) means a double-clicked Approve
+# button or a retried webhook awaits the same API call instead of racing
+# past an empty cache and minting two links.
+_INVITE_CACHE = {}  # key -> (deadline, task)
+_INVITE_CACHE_TTL = 60  # seconds
+_INVITE_CACHE_MAX = 128
+
+async def create_invite_link_cached(bot, user_id, days):
+    key = (user_id, days)
+    now = time.monotonic()
+    cached = _INVITE_CACHE.pop(key, None)
+    if cached and cached[0] > now:
+        # Re-insert on hit so eviction order is least-recently-used
+        _INVITE_CACHE[key] = cached
+        return await cached[1]
+    task = asyncio.get_running_loop().create_task(bot.create_chat_invite_link(
+        chat_id=PRIVATE_CHANNEL_ID,
+        member_limit=1,
+        expire_date=int(time.time()) + days * 86400
+    ))
+    if len(_INVITE_CACHE) >= _INVITE_CACHE_MAX:
+        # Keep the cache bounded; least recently used goes first
+        _INVITE_CACHE.pop(next(iter(_INVITE_CACHE)))
+    _INVITE_CACHE[key] = (now + _INVITE_CACHE_TTL, task)
+    try:
+        return await task
+    except Exception:
+        # Don't cache failures; guard against a newer entry for the key
+        entry = _INVITE_CACHE.get(key)
+        if entry is not None and entry[1] is task:
+            del _INVITE_CACHE[key]
+        raise
 
 # -------------------- Telegram Bot Handlers --------------------
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -140,7 +296,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"✅ ክፍያ ይፈጽሙ\n"
         f"🔓 ወዲያውኑ መግቢያ ያግኙ"
     )
-    await update.message.reply_text(welcome_text, parse_mode="Markdown", reply_markup=plan_keyboard())
+    await update.message.reply_text(welcome_text, parse_mode="Markdown", reply_markup=PLAN_KEYBOARD)
 
 async def plan_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -176,7 +332,7 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(
             "🇺🇸 Please first choose a subscription plan using /start.\n"
             "🇪🇹 እባክዎ መጀመሪያ የደንበኝነት ምርጫዎን ይምረጡ።",
-            reply_markup=plan_keyboard()
+            reply_markup=PLAN_KEYBOARD
         )
         return
 
@@ -196,25 +352,31 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"Plan: {months} month(s) – {price} Birr\n"
         f"Telebirr account: `{TELEBIRR_ACCOUNT}`"
     )
-    keyboard = [
+    reply_markup = InlineKeyboardMarkup([
         [
-            InlineKeyboardButton(f"✅ Approve ({months} months)", callback_data=f"approve:{user.id}:{months}"),
-            InlineKeyboardButton("❌ Decline", callback_data=f"decline:{user.id}")
+            InlineKeyboardButton(_APPROVE_LABEL.format(months=months), callback_data=f"approve:{user.id}:{months}"),
+            InlineKeyboardButton(_DECLINE_LABEL, callback_data=f"decline:{user.id}")
         ]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    ])
 
-    for admin_id in ADMIN_IDS:
-        try:
-            await context.bot.send_photo(
+    # Fan out to all admins concurrently – the requests are independent,
+    # so total latency is one network round-trip instead of one per admin.
+    results = await asyncio.gather(
+        *(
+            context.bot.send_photo(
                 chat_id=admin_id,
                 photo=photo.file_id,
                 caption=caption,
                 reply_markup=reply_markup,
                 parse_mode="Markdown"
             )
-        except Exception as e:
-            print(f"Failed to send to admin {admin_id}: {e}")
+            for admin_id in ADMIN_IDS
+        ),
+        return_exceptions=True,
+    )
+    for admin_id, result in zip(ADMIN_IDS, results):
+        if isinstance(result, Exception):
+            logger.warning("Failed to send to admin %s: %s", admin_id, result)
 
     await update.message.reply_text(
         "✅ Your screenshot has been sent. You'll be notified once approved.\n\n"
@@ -222,46 +384,56 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     context.user_data.clear()
 
+async def _approve_action(query, context, user_id, data):
+    if len(data) < 3 or not data[2].isdigit():
+        return
+    months = int(data[2])
+    await add_subscription_async(user_id, months * 30)
+    try:
+        invite_link = await create_invite_link_cached(context.bot, user_id, months * 30)
+        await context.bot.send_message(
+            chat_id=user_id,
+            text=(
+                f"🎉 *Your payment has been approved! / ክፍያዎ ጸድቋል!*\n\n"
+                f"🇺🇸 You have been granted access for {months} month(s).\n"
+                f"Here is your invite link:\n{invite_link.invite_link}\n\n"
+                f"🇪🇹 የ{months} ወር መዳረሻ ተሰጥቶዎታል።\n"
+                f"የመግቢያ ሊንክዎ ይህ ነው።"
+            ),
+            parse_mode="Markdown"
+        )
+        await query.edit_message_text(
+            text=f"✅ Approved user `{user_id}` for {months} months.\n\nInvite link sent.",
+            parse_mode="Markdown"
+        )
+    except Exception as e:
+        await query.edit_message_text(f"❌ Approval failed: {e}")
+
+async def _decline_action(query, context, user_id, data):
+    await query.edit_message_text(f"❌ Declined user `{user_id}`.", parse_mode="Markdown")
+
+# Dict dispatch instead of an if/elif chain over action strings; unknown or
+# malformed callback data falls through without raising.
+_CALLBACK_ACTIONS = {
+    "approve": _approve_action,
+    "decline": _decline_action,
+}
+
 async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
 
-    if query.from_user.id not in ADMIN_IDS:
+    if query.from_user.id not in ADMIN_ID_SET:
         await query.edit_message_text("⛔ Unauthorized.")
         return
 
     data = query.data.split(":")
-    action = data[0]
-    user_id = int(data[1])
-
-    if action == "approve":
-        months = int(data[2])
-        add_subscription(user_id, months * 30)
-        try:
-            invite_link = await context.bot.create_chat_invite_link(
-                chat_id=PRIVATE_CHANNEL_ID,
-                member_limit=1,
-                expire_date=int(time.time()) + months * 30 * 86400
-            )
-            await context.bot.send_message(
-                chat_id=user_id,
-                text=(
-                    f"🎉 *Your payment has been approved! / ክፍያዎ ጸድቋል!*\n\n"
-                    f"🇺🇸 You have been granted access for {months} month(s).\n"
-                    f"Here is your invite link:\n{invite_link.invite_link}\n\n"
-                    f"🇪🇹 የ{months} ወር መዳረሻ ተሰጥቶዎታል።\n"
-                    f"የመግቢያ ሊንክዎ ይህ ነው።"
-                ),
-                parse_mode="Markdown"
-            )
-            await query.edit_message_text(
-                text=f"✅ Approved user `{user_id}` for {months} months.\n\nInvite link sent.",
-                parse_mode="Markdown"
-            )
-        except Exception as e:
-            await query.edit_message_text(f"❌ Approval failed: {e}")
-    elif action == "decline":
-        await query.edit_message_text(f"❌ Declined user `{user_id}`.", parse_mode="Markdown")
+    if len(data) < 2 or not data[1].isdigit():
+        return
+    handler = _CALLBACK_ACTIONS.get(data[0])
+    if handler is None:
+        return
+    await handler(query, context, int(data[1]), data)
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     help_text = (
@@ -279,7 +451,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    expiry = get_subscription_expiry(user_id)
+    expiry = await get_subscription_expiry_async(user_id)
     if expiry and expiry > int(time.time()):
         remaining = expiry - int(time.time())
         days = remaining // 86400
@@ -305,33 +477,37 @@ async def renew_request(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 parse_mode="Markdown"
             )
         except Exception as e:
-            print(f"Failed to notify admin {admin_id}: {e}")
+            logger.warning("Failed to notify admin %s: %s", admin_id, e)
     await update.message.reply_text(
         "📩 Your renewal request has been sent to the admins.\n\n"
         "📩 የእድሳት ጥያቄዎ ለአስተዳዳሪዎች ተልኳል።"
     )
 
 async def approve_manual(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_user.id not in ADMIN_IDS:
+    if update.effective_user.id not in ADMIN_ID_SET:
         await update.message.reply_text("⛔ Unauthorized.")
         return
     if len(context.args) < 1:
         await update.message.reply_text("Usage: /approve <user_id> [months]")
         return
-    try:
-        user_id = int(context.args[0])
-        months = int(context.args[1]) if len(context.args) > 1 else 1
-    except ValueError:
+    # Digit-guarded parsing (same pattern as PRIVATE_CHANNEL_ID at load
+    # time) instead of try/except around int() on the command path.
+    # removeprefix strips at most one dash, so "--5" is rejected here
+    # rather than blowing up in int().
+    if not context.args[0].removeprefix("-").isdigit():
         await update.message.reply_text("Invalid arguments.")
         return
-
-    add_subscription(user_id, months * 30)
+    user_id = int(context.args[0])
+    months = 1
+    if len(context.args) > 1:
+        if not context.args[1].isdigit():
+            await update.message.reply_text("Invalid arguments.")
+            return
+        months = int(context.args[1])
+
+    await add_subscription_async(user_id, months * 30)
     try:
-        invite_link = await context.bot.create_chat_invite_link(
-            chat_id=PRIVATE_CHANNEL_ID,
-            member_limit=1,
-            expire_date=int(time.time()) + months * 30 * 86400
-        )
+        invite_link = await create_invite_link_cached(context.bot, user_id, months * 30)
         await context.bot.send_message(
             chat_id=user_id,
             text=(
@@ -344,16 +520,11 @@ async def approve_manual(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"❌ Approval failed: {e}")
 
 async def list_subscribers(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_user.id not in ADMIN_IDS:
+    if update.effective_user.id not in ADMIN_ID_SET:
         await update.message.reply_text("⛔ Unauthorized.")
         return
     now = int(time.time())
-    with db_lock:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("SELECT user_id, expiry_date FROM subscriptions ORDER BY expiry_date")
-        rows = c.fetchall()
-        conn.close()
+    rows = await get_all_subscriptions_async()
     if not rows:
         await update.message.reply_text("No active subscribers.")
         return
@@ -374,49 +545,66 @@ application.add_handler(CallbackQueryHandler(plan_callback, pattern="^plan:"))
 application.add_handler(CallbackQueryHandler(handle_callback, pattern="^(approve|decline):"))
 application.add_handler(MessageHandler(filters.PHOTO, handle_photo))
 
-# Initialize the application (no updater, so no background tasks start)
-async def init_app():
+# The bot shares the serving loop, so initialize/shutdown it with the app.
+# No need to call start() – it would only start job queue, which we don't use
+@app.before_serving
+async def _startup():
     await application.initialize()
-    # No need to call start() – it would only start job queue, which we don't use
 
-asyncio.run(init_app())
+@app.after_serving
+async def _shutdown():
+    await application.shutdown()
+
+# Keep strong references to in-flight update tasks so they aren't GC'd
+# before finishing (we ACK the webhook without awaiting them).
+_background_tasks = set()
+
+def _process_update_in_background(update):
+    task = asyncio.get_running_loop().create_task(application.process_update(update))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
 
-# -------------------- Flask Routes --------------------
+# -------------------- Quart Routes --------------------
 @app.route("/")
-def home():
+async def home():
     return "Bot is running (webhook mode)", 200
 
 @app.route("/status")
-def status():
+async def status():
     return "OK", 200
 
 @app.route("/webhook", methods=["POST"])
-def webhook():
+async def webhook():
     """Handle incoming Telegram updates via webhook."""
     try:
-        data = request.get_json(force=True)
+        # orjson parses the update payload several times faster than the
+        # stdlib json used by get_json(), straight from the raw bytes.
+        data = orjson.loads(await request.get_data())
         update = Update.de_json(data, application.bot)
-        # Process update synchronously in a new event loop
-        asyncio.run(application.process_update(update))
+        # Schedule processing on the serving loop and acknowledge immediately.
+        # Waiting for process_update (admin fan-out etc.) here would make
+        # Telegram retry slow updates and cap throughput at serial latency.
+        _process_update_in_background(update)
         return "OK", 200
     except Exception as e:
-        print(f"Error in webhook: {e}")
+        logger.exception("Error in webhook: %s", e)
         return "OK", 200  # Always return OK to acknowledge receipt
 
 @app.route("/set_webhook")
-def set_webhook():
+async def set_webhook():
     """Register the webhook with Telegram."""
-    async def set_hook():
-        await application.bot.set_webhook(url=WEBHOOK_URL)
-    asyncio.run(set_hook())
+    await application.bot.set_webhook(
+        url=WEBHOOK_URL,
+        allowed_updates=["message", "callback_query"],
+        max_connections=100,
+        drop_pending_updates=True,
+    )
     return f"✅ Webhook set to {WEBHOOK_URL}"
 
 @app.route("/webhook_info")
-def webhook_info():
+async def webhook_info():
     """Get current webhook status from Telegram."""
-    async def get_info():
-        return await application.bot.get_webhook_info()
-    info = asyncio.run(get_info())
+    info = await application.bot.get_webhook_info()
     return f"""
     <html>
     <body>
@@ -430,29 +618,36 @@ def webhook_info():
     """
 
 @app.route("/cleanup")
-def cleanup_expired():
+async def cleanup_expired():
     """Remove expired users from channel and database."""
     token = request.args.get("token")
     if token != "habeshaVVIP2025":  # Change this to your secret token
         return "Unauthorized", 403
 
     now = int(time.time())
-    expired = get_expired_users(now)
+    expired = await get_expired_users_async(now)
+    banned = []
     for user_id in expired:
         try:
-            asyncio.run(application.bot.ban_chat_member(
+            await application.bot.ban_chat_member(
                 chat_id=PRIVATE_CHANNEL_ID,
                 user_id=user_id
-            ))
-            remove_subscription(user_id)
-            asyncio.run(application.bot.send_message(
+            )
+            banned.append(user_id)
+            await application.bot.send_message(
                 chat_id=user_id,
                 text="Your subscription has expired. To renew, please send a new payment screenshot."
-            ))
+            )
         except Exception as e:
-            print(f"Error removing user {user_id}: {e}")
-    return f"Removed {len(expired)} expired users."
-
-# -------------------- Run Flask --------------------
+            logger.warning("Error removing user %s: %s", user_id, e)
+    # Only drop rows for users actually banned; failed bans stay in the
+    # table and are retried on the next sweep. Still one commit total.
+    await remove_subscriptions_async(banned)
+    return f"Removed {len(banned)} expired users."
+
+# -------------------- Run Quart --------------------
+# Production runs under uvicorn via the Procfile (web: uvicorn bot:app ...);
+# running this module directly is for local development only.
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=PORT)
\ No newline at end of file
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=PORT)
\ No newline at end of file